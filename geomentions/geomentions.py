@@ -1,10 +1,25 @@
+import functools
+import heapq
+import itertools
 import json
-from collections import Counter, namedtuple
+import re
+from collections import OrderedDict, namedtuple
 import regex
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Set, Mapping
 import gzip
 import os
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+
+# A word is a run of Unicode letters (\p{L}), combining marks (\p{M}) and numbers (\p{N}). This preserves full
+# characters in scripts like Tamil or other languages. A possessive suffix directly following a letter (e.g. the
+# "'s" in "München's") is consumed by the match but not captured, so it is dropped from the word.
+_TOKEN_RE = regex.compile(r"([\p{L}\p{M}\p{N}]+)(?:(?<=\p{L})'[\p{L}\p{M}]*)*")
+
+# The same pattern restricted to ASCII, where letters and numbers reduce to plain character ranges. The standard
+# library `re` module matches these from a bitmap and is considerably faster than `regex` on ASCII-only text.
+_ASCII_TOKEN_RE = re.compile(r"([A-Za-z0-9]+)(?:(?<=[A-Za-z])'[A-Za-z]*)*")
 
 
 def get_data_path(path):
@@ -19,6 +34,99 @@ def get_data_path(path):
     """
     return os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', path)
 
+def load_index(casefold: bool = False) -> Tuple[Mapping, Mapping]:
+    """
+    Load the city and country indices from the shared index file in the 'data' directory.
+
+    Every location is stored only once in the file and all of its spellings refer to it by position. The returned
+    indices therefore share a single entry dictionary between all keys that point to the same location. The
+    locations are stored column by column, with country codes and time zones encoded as positions in lists of their
+    distinct values, so that each distinct value is only decoded once.
+
+    The file is only decoded on the first call; later calls return the same indices, so all GeoMentions instances
+    in a process share them. To keep changes from leaking between instances, the indices and their entries are
+    returned as read-only mappings, with the coordinates as (latitude, longitude) tuples.
+
+    Parameters:
+        casefold (bool): If True, return indices with case-folded keys (see `casefold_index`). Defaults to False.
+
+    Returns:
+        Tuple[Mapping, Mapping]: The city index and the country index, each mapping a key to its entry.
+    """
+    return _load_index(bool(casefold))
+
+@functools.lru_cache(maxsize=None)
+def _load_index(casefold: bool) -> Tuple[Mapping, Mapping]:
+    """
+    Load the indices as described in `load_index`. The argument is always passed positionally as a bool, so that every
+    call for the same indices hits the same cache entry.
+    """
+    if casefold:
+        city_index, country_index = _load_index(False)
+        return MappingProxyType(casefold_index(city_index)), MappingProxyType(casefold_index(country_index))
+
+    with gzip.open(get_data_path("index.json.gz"), "rt", encoding="utf-8") as fp:
+        data = json.load(fp)
+    records, country_codes, timezones = data["records"], data["country_codes"], data["timezones"]
+    entries = [
+        MappingProxyType({
+            "name": name,
+            "country_code": country_codes[country_code_id],
+            "population": population,
+            "timezone": timezones[timezone_id],
+            "coordinates": (latitude, longitude),
+        })
+        for name, country_code_id, population, timezone_id, latitude, longitude in zip(
+            records["name"], records["country_code"], records["population"],
+            records["timezone"], records["latitude"], records["longitude"],
+        )
+    ]
+    city_index = {key: entries[record_id] for key, record_id in data["city"].items()}
+    country_index = {key: entries[record_id] for key, record_id in data["country"].items()}
+    return MappingProxyType(city_index), MappingProxyType(country_index)
+
+def casefold_index(index: dict) -> dict:
+    """
+    Return a copy of an index with case-folded keys.
+
+    If several keys only differ in case (e.g. "Nice" and "NICE"), the entry with the highest population is kept.
+
+    Parameters:
+        index (dict): The index to case-fold.
+
+    Returns:
+        dict: A dictionary mapping each case-folded key to its entry.
+    """
+    folded = {}
+    for key, entry in index.items():
+        key = key.casefold()
+        current = folded.get(key)
+        if current is None or entry["population"] > current["population"]:
+            folded[key] = entry
+    return folded
+
+def load_phrase_table(casefold: bool = False) -> Set[str]:
+    """
+    Build the phrase table for the indices returned by `load_index` (see `GeoMentions._build_phrase_table`).
+
+    Like the indices, the table is only built on the first call and then shared by all GeoMentions instances in a
+    process that use these indices.
+
+    Parameters:
+        casefold (bool): If True, build the table for the case-folded indices. Defaults to False.
+
+    Returns:
+        Set[str]: The set of all keys and all word prefixes of multi-word keys.
+    """
+    return _load_phrase_table(bool(casefold))
+
+@functools.lru_cache(maxsize=None)
+def _load_phrase_table(casefold: bool) -> Set[str]:
+    """
+    Build the phrase table as described in `load_phrase_table`, cached on the normalized argument.
+    """
+    return GeoMentions._build_phrase_table(*load_index(casefold))
+
 class GeoResult:
     """
     Represents a geographical location result with associated metadata.
@@ -31,6 +139,8 @@ class GeoResult:
         time_zone (str): The time zone of the location.
         coordinates (str): The geographical coordinates of the location.
     """
+    __slots__ = ("key", "name", "country_code", "population", "time_zone", "coordinates")
+
     def __init__(self, name, entry):
         self.key: str = name
         self.name: str = entry.get('name')
@@ -106,45 +216,130 @@ class GeoMentionsResult:
                   - implicit_count: Count from city mentions only.
                   - explicit_count: Count from country mentions only.
         """
-        country_counter = Counter()
-        implicit_counter = Counter()
-        explicit_counter = Counter()
+        # Implicit and explicit counts per country, kept together so that each mention needs a single lookup.
+        counts = {}
 
         for city in self.city_mentions:
             if city.country_code:
-                country_counter[city.country_code] += city.count
-                implicit_counter[city.country_code] += city.count
+                country_count = counts.get(city.country_code)
+                if country_count is None:
+                    counts[city.country_code] = [city.count, 0]
+                else:
+                    country_count[0] += city.count
 
         for country in self.country_mentions:
-            country_counter[country.country_code] += country.count
-            explicit_counter[country.country_code] += country.count
+            country_count = counts.get(country.country_code)
+            if country_count is None:
+                counts[country.country_code] = [0, country.count]
+            else:
+                country_count[1] += country.count
 
         return {
             country: {
-                "total_count": country_counter[country],
-                "implicit_count": implicit_counter[country],
-                "explicit_count": explicit_counter[country]
+                "total_count": implicit_count + explicit_count,
+                "implicit_count": implicit_count,
+                "explicit_count": explicit_count
             }
-            for country in country_counter
+            for country, (implicit_count, explicit_count) in counts.items()
         }
 
 class GeoMentions:
     """
-    Processes text to identify and count geographical mentions using preloaded city and country indices.
+    Processes text to identify and count geographical mentions using city and country indices. The default indices
+    are loaded on first use and shared by all instances in a process.
+
+    Parameters:
+        standardize_names (bool): If True, all spellings of a location are counted under its standardized name.
+        cache_size (int): Number of most recently fitted texts whose results are cached, so that repeated texts are
+            not processed again. Defaults to 0 (no caching).
+        case_sensitive (bool): If False, text and index keys are case-folded so that e.g. "paris", "Paris" and
+            "PARIS" all match. Note that this also matches common words that are spelled like a place (e.g. "nice"
+            or "bath") and that case folding is not locale-aware (e.g. the Turkish dotted and dotless I).
+            Defaults to True.
     """
-    def __init__(self, standardize_names=True):
+    def __init__(self, standardize_names=True, cache_size=0, case_sensitive=True):
         self.standardize_names = standardize_names
-        with gzip.open(get_data_path("city_index.json.gz"), "rt", encoding="utf-8") as fp:
-            self.city_index = json.load(fp)
-        with gzip.open(get_data_path("country_index.json.gz"), "rt", encoding="utf-8") as fp:
-            self.country_index = json.load(fp)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # None stands for the shared default index (see `load_index`), which is only loaded on first use.
+        self._city_index = self._country_index = None
+        self._phrases = None
+        self.case_sensitive = case_sensitive
+
+    @property
+    def case_sensitive(self) -> bool:
+        """
+        Whether text and index keys are matched case-sensitively. Changing it switches to the matching default indices
+        and discards cached results.
+        """
+        return self._case_sensitive
+
+    @case_sensitive.setter
+    def case_sensitive(self, case_sensitive: bool):
+        self._case_sensitive = case_sensitive
+        self._invalidate()
+
+    @property
+    def city_index(self) -> Mapping:
+        """
+        The city index, mapping each key to its entry. The index loaded by default is read-only and shared by all
+        instances; to change it, assign a modified copy.
+        """
+        if self._city_index is None:
+            return load_index(not self.case_sensitive)[0]
+        return self._city_index
+
+    @city_index.setter
+    def city_index(self, index: Mapping):
+        self._city_index = index
+        self._invalidate()
+
+    @property
+    def country_index(self) -> Mapping:
+        """
+        The country index, mapping each key to its entry. The index loaded by default is read-only and shared by all
+        instances; to change it, assign a modified copy.
+        """
+        if self._country_index is None:
+            return load_index(not self.case_sensitive)[1]
+        return self._country_index
+
+    @country_index.setter
+    def country_index(self, index: Mapping):
+        self._country_index = index
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Reset all state derived from the indices. The phrase table is rebuilt on the next scan.
+        """
+        self._phrases = None
+        self._cache.clear()
+
+    def _phrase_table(self) -> Set[str]:
+        """
+        Return the phrase table for the current indices.
+
+        Instances using the indices returned by `load_index` share the table of `load_phrase_table`. For indices that
+        were assigned to this instance, a table of its own is built.
+
+        Returns:
+            Set[str]: The set of all keys and all word prefixes of multi-word keys.
+        """
+        if self._phrases is None:
+            if self._city_index is None and self._country_index is None:
+                self._phrases = load_phrase_table(not self.case_sensitive)
+            else:
+                self._phrases = self._build_phrase_table(self.city_index, self.country_index)
+        return self._phrases
 
     def _split_text(self, text: str) -> List[str]:
         """
         Normalize the input text and split it into a list of words.
 
-        The method normalizes Unicode text to NFKC, removes specific possessive patterns, replaces non-alphanumeric
-        characters (except for letters, marks, numbers, and whitespace) with spaces, and then splits the text by whitespace.
+        The method normalizes Unicode text to NFKC (and case-folds it if the instance is not case-sensitive) and extracts
+        all runs of letters, marks and numbers in a single pass. Any other character acts as a separator and possessive
+        suffixes are dropped.
 
         Parameters:
             text (str): The input text to process.
@@ -152,34 +347,97 @@ class GeoMentions:
         Returns:
             List[str]: A list of processed words extracted from the text.
         """
-        # Normalize Unicode text to NFKC form for consistent representation.
+        # ASCII text is already in NFKC form and can be split with the faster ASCII-only pattern.
+        if text.isascii():
+            if not self.case_sensitive:
+                text = text.lower()
+            return _ASCII_TOKEN_RE.findall(text)
+
+        # Normalize Unicode text to NFKC form for consistent representation. Text that is already in NFKC form is
+        # detected by a quick check inside `normalize` and returned as is, without a copy.
         text = unicodedata.normalize('NFKC', text)
+        if not self.case_sensitive:
+            text = text.casefold()
 
-        text = regex.sub(r"(?<=\p{L})'[\p{L}\p{M}]*", '', text)
+        return _TOKEN_RE.findall(text)
 
-        # Replace any character that is NOT:
-        # - a Unicode letter (\p{L})
-        # - a Unicode combining mark (\p{M})
-        # - a Unicode number (\p{N})
-        # - whitespace (\s)
-        # with a space. This preserves full characters in scripts like Tamil or other languages.
-        text = regex.sub(r"[^\p{L}\p{M}\p{N}\s]", " ", text)
+    @staticmethod
+    def _build_phrase_table(*indices: dict) -> Set[str]:
+        """
+        Build the shared phrase table used for lookups across all given indices.
 
-        # Split the text into words based on whitespace.
-        return text.split()
+        The table holds every key of the given indices together with every word prefix of multi-word keys (e.g.
+        "New" and "New York" for "New York City"). It acts as a flattened word-level trie: a phrase only needs to be
+        looked up in the indices, and extended by the next word, while it is contained in this table. Most words
+        of a text are not in the table and are rejected with a single set lookup.
 
-    def _generate_bigrams(self, word_list: List[str]) -> List[Tuple[str, str]]:
+        Parameters:
+            *indices (dict): The indices whose keys should be matchable.
+
+        Returns:
+            Set[str]: The set of all keys and all word prefixes of multi-word keys.
+        """
+        phrases = set()
+        for index in indices:
+            phrases.update(index)
+        for index in indices:
+            for key in index:
+                end = key.rfind(' ')
+                while end > 0:
+                    prefix = key[:end]
+                    if prefix in phrases:
+                        break
+                    phrases.add(prefix)
+                    end = key.rfind(' ', 0, end)
+        return phrases
+
+    def _scan(self, words: List[str]) -> Tuple[List[GeoResult], List[GeoResult]]:
         """
-        Generate bigrams from a list of words.
+        Identify city and country mentions in a list of words in a single pass.
+
+        At each word position the phrase is extended word by word as long as it is contained in the phrase table,
+        and the longest key found per level is kept (leftmost-longest matching). Words covered by a match are not
+        considered again for the same level.
 
         Parameters:
-            word_list (List[str]): A list of words.
+            words (List[str]): The words as returned by `_split_text`.
 
         Returns:
-            List[Tuple[str, str]]: A list of tuples where each tuple consists of two consecutive words.
+            Tuple[List[GeoResult], List[GeoResult]]: The detected city mentions and country mentions.
         """
-
-        return [(word_list[i], word_list[i + 1]) for i in range(len(word_list) - 1)]
+        cities, countries = [], []
+        city_index, country_index, phrases = self.city_index, self.country_index, self._phrase_table()
+        city_end = country_end = 0
+        n_words = len(words)
+
+        for start in range(n_words):
+            if start < city_end and start < country_end:
+                continue
+            city_hit = country_hit = None
+            phrase = words[start]
+            end = start + 1
+            while phrase in phrases:
+                if start >= city_end:
+                    entry = city_index.get(phrase)
+                    if entry is not None:
+                        city_hit = (phrase, entry, end)
+                if start >= country_end:
+                    entry = country_index.get(phrase)
+                    if entry is not None:
+                        country_hit = (phrase, entry, end)
+                if end == n_words:
+                    break
+                phrase = phrase + ' ' + words[end]
+                end += 1
+
+            if city_hit is not None:
+                cities.append(GeoResult(city_hit[0], city_hit[1]))
+                city_end = city_hit[2]
+            if country_hit is not None:
+                countries.append(GeoResult(country_hit[0], country_hit[1]))
+                country_end = country_hit[2]
+
+        return cities, countries
 
     def _find_mentions(self, sample: str, level: str) -> List[GeoResult]:
         """
@@ -192,45 +450,30 @@ class GeoMentions:
         Returns:
             List[GeoResult]: A list of GeoResult objects representing the detected geographical mentions.
         """
-        collection = []
-        index = self.city_index if level == 'city' else self.country_index
-        words = self._split_text(sample)
-        matched_words = set()
-
-        if len(words) == 1:
-            entry = index.get(words[0])
-            if entry is not None:
-                collection.append(GeoResult(words[0], entry))
-        else:
-            for bigram in self._generate_bigrams(words):
-                bigram_lookup = " ".join(bigram)
-                entry = index.get(bigram_lookup)
-                if entry is not None:
-                    collection.append(GeoResult(bigram_lookup, entry))
-                    matched_words.update(bigram)
-
-            for word in words:
-                if word in matched_words:
-                    continue
-                entry = index.get(word)
-                if entry:
-                    collection.append(GeoResult(word, entry))
-
-        return collection
-
-    def count_results(self, collection: List[GeoResult], standardize_names: bool) -> List[CityMention]:
+        cities, countries = self._scan(self._split_text(sample))
+        return cities if level == 'city' else countries
+
+    def count_results(self, collection: List[GeoResult], standardize_names: bool,
+                      top_k: Optional[int] = None) -> List[CityMention]:
         """
         Aggregate and count occurrences of geographical mentions from a collection of GeoResult objects.
 
         Parameters:
             collection (List[GeoResult]): The list of geographical results to count.
             standardize_names (bool): If True, counts are aggregated based on the standardized name; otherwise, based on the key.
+            top_k (Optional[int]): If given, only the top_k most frequent mentions are returned. Defaults to None.
 
         Returns:
             List[CityMention]: A sorted list of CityMention records ordered by descending count.
         """
-        key_fn = lambda result: result.name if standardize_names else result.key
-        counts = Counter(key_fn(city) for city in collection)
+        # Count and remember the last result per key in a single pass over the collection. Keys keep the order in which
+        # they were first seen, while the reported attributes are those of the last result with that key.
+        counts, last_seen = {}, {}
+        for city in collection:
+            key = city.name if standardize_names else city.key
+            counts[key] = counts.get(key, 0) + 1
+            last_seen[key] = city
+
         results = [
             CityMention(
                 name=key,
@@ -239,24 +482,115 @@ class GeoMentions:
                 population=city.population,
                 coordinates=city.coordinates,
             )
-            for key, city in {key_fn(city): city for city in collection}.items()
+            for key, city in last_seen.items()
         ]
+        if top_k is not None:
+            return heapq.nlargest(top_k, results, key=lambda x: x.count)
         return sorted(results, key=lambda x: x.count, reverse=True)
 
-    def fit(self, text: str) -> GeoMentionsResult:
+    def fit(self, text: str, top_k: Optional[int] = None) -> GeoMentionsResult:
         """
         Process the input text to extract and aggregate geographical mentions for both cities and countries.
 
         Parameters:
             text (str): The text to analyze for geographical mentions.
+            top_k (Optional[int]): If given, only the top_k most frequent city and country mentions are kept.
+                Defaults to None.
 
         Returns:
             GeoMentionsResult: An object containing the aggregated results for city and country mentions.
         """
-        city_collection = self._find_mentions(text, level='city')
-        country_collection = self._find_mentions(text, level='country')
+        if self.cache_size:
+            cache_key = (self.standardize_names, top_k, text)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                # Cached mentions are stored as tuples, every caller gets its own lists.
+                return GeoMentionsResult(list(cached[0]), list(cached[1]))
+
+        city_collection, country_collection = self._scan(self._split_text(text))
 
-        city_mentions = self.count_results(city_collection, self.standardize_names)
-        country_mentions = self.count_results(country_collection, self.standardize_names)
+        city_mentions = self.count_results(city_collection, self.standardize_names, top_k)
+        country_mentions = self.count_results(country_collection, self.standardize_names, top_k)
+
+        if self.cache_size:
+            self._cache[cache_key] = (tuple(city_mentions), tuple(country_mentions))
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
 
         return GeoMentionsResult(city_mentions, country_mentions)
+
+    def fit_batch(self, texts: List[str], n_jobs: Optional[int] = None, top_k: Optional[int] = None,
+                  mp_context=None) -> List[GeoMentionsResult]:
+        """
+        Process a batch of texts in parallel worker processes.
+
+        Each worker sets up its own GeoMentions instance with the settings of this instance once and then processes
+        its share of the texts. Each worker keeps its own result cache of `cache_size` texts. The default indices and
+        their phrase table are loaded in this process before the workers are started, so that worker processes started
+        by forking share them instead of loading them again.
+
+        Parameters:
+            texts (List[str]): The texts to analyze for geographical mentions.
+            n_jobs (Optional[int]): Number of worker processes. Defaults to None (one per CPU). If 1, the texts are
+                processed in the current process.
+            top_k (Optional[int]): If given, only the top_k most frequent city and country mentions are kept per text.
+                Defaults to None.
+            mp_context: The multiprocessing context used to start the workers, e.g.
+                `multiprocessing.get_context("spawn")`. Defaults to None (the default start method of the platform).
+
+        Returns:
+            List[GeoMentionsResult]: The results for all texts, in the order of the input texts.
+        """
+        if n_jobs == 1:
+            return [self.fit(text, top_k) for text in texts]
+
+        self._phrase_table()
+
+        # Indices that were replaced on this instance have to be sent to the workers explicitly. Default indices are
+        # passed as None and loaded by the workers themselves.
+        indices = tuple(None if index is None else _plain_index(index) for index in (self._city_index, self._country_index))
+
+        n_workers = n_jobs or os.cpu_count() or 1
+        chunksize = max(1, len(texts) // (n_workers * 4))
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_worker,
+                                 initargs=(self.standardize_names, self.cache_size, self.case_sensitive, indices)) as executor:
+            return list(executor.map(_fit_in_worker, texts, itertools.repeat(top_k), chunksize=chunksize))
+
+def _plain_index(index: Mapping) -> dict:
+    """
+    Copy an index into plain dictionaries that can be pickled and sent to worker processes. Entries taken from the
+    shared default index are read-only mappings, which cannot be pickled. An entry shared by several keys is copied
+    only once, so that it is still only sent once.
+    """
+    copies = {}
+    plain = {}
+    for key, entry in index.items():
+        if isinstance(entry, Mapping):
+            if id(entry) not in copies:
+                copies[id(entry)] = dict(entry)
+            entry = copies[id(entry)]
+        plain[key] = entry
+    return plain
+
+# GeoMentions instance of a worker process used by `GeoMentions.fit_batch`.
+_worker = None
+
+def _init_worker(standardize_names: bool, cache_size: int, case_sensitive: bool,
+                 indices: Tuple[Optional[dict], Optional[dict]]):
+    """
+    Set up the GeoMentions instance of a worker process. Indices given as None are the shared default indices.
+    """
+    global _worker
+    _worker = GeoMentions(standardize_names=standardize_names, cache_size=cache_size, case_sensitive=case_sensitive)
+    city_index, country_index = indices
+    if city_index is not None:
+        _worker.city_index = city_index
+    if country_index is not None:
+        _worker.country_index = country_index
+
+def _fit_in_worker(text: str, top_k: Optional[int]) -> GeoMentionsResult:
+    """
+    Process a single text with the GeoMentions instance of a worker process.
+    """
+    return _worker.fit(text, top_k)
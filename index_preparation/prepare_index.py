@@ -3,44 +3,52 @@
 # Download Link for zip archive: https://download.geonames.org/export/dump/allCountries.zip
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import json
 import numpy as np
 import gzip
 
+# Fields stored per location
+FIELDS = ['name', 'country_code', 'population', 'timezone', 'coordinates']
+
 
 def create_index(level = 'city'):
 	"""
-	Generate and save an index of geographical data from the Geonames.org dataset.
+	Generate an index of geographical data from the Geonames.org dataset.
 
 	This function reads data from 'allCountries.txt', filters and processes the dataset based on the specified
 	geographical level ('city' or 'country'). For the 'city' level, it selects records with feature class 'P' and
 	feature codes such as 'PPL', 'PPLA', 'PPLA2', 'PPLA3', 'PPLA4', and 'PPLC', and filters for cities with a population
 	greater than 1000. For the 'country' level, it selects records with feature class 'A' and feature code 'PCLI'.
 	The function then processes the 'alternatenames' column by splitting comma-separated names into lists, exploding the
-	DataFrame, filling missing alternate names with the main name, and sorting to retain the entry with the highest population
+	DataFrame, filling missing alternate names with the main name, and retaining the entry with the highest population
 	for each alternate name. It removes duplicate keys (alternate names) that are shorter than 3 characters, creates a dictionary
-	mapping each alternate name to a dictionary of attributes (name, country_code, population, timezone, and coordinates),
-	and finally saves this index as a gzipped JSON file in the '../geomentions/data/' directory.
+	mapping each alternate name to its geonameid and attributes (name, country_code, population, timezone, and coordinates),
+	and returns this index.
 
 	Parameters:
 	    level (str, optional): The geographical level to index. Must be either 'city' or 'country'. Defaults to 'city'.
 
 	Returns:
-	    None
-
-	Side Effects:
-	    Writes a gzipped JSON file named '{level}_index.json.gz' to the '../geomentions/data/' directory.
+	    dict: A dictionary mapping each key to a tuple of the record fields defined in `FIELDS`, preceded by the geonameid.
 	"""
-	columns = [
-		"geonameid", "name", "asciiname", "alternatenames", "latitude", "longitude",
-		"feature_class", "feature_code", "country_code", "cc2", "admin1_code",
-		"admin2_code", "admin3_code", "admin4_code", "population", "elevation",
-		"dem", "timezone", "modification_date"
-	]
-	df = pd.read_csv('allCountries.txt', sep='\t',
-					 low_memory=False,
-					 names=columns
-					)
+	column_types = {
+		"geonameid": pa.int64(), "name": pa.string(), "asciiname": pa.string(), "alternatenames": pa.string(),
+		"latitude": pa.float64(), "longitude": pa.float64(), "feature_class": pa.string(), "feature_code": pa.string(),
+		"country_code": pa.string(), "cc2": pa.string(), "admin1_code": pa.string(), "admin2_code": pa.string(),
+		"admin3_code": pa.string(), "admin4_code": pa.string(), "population": pa.int64(), "elevation": pa.int64(),
+		"dem": pa.int64(), "timezone": pa.string(), "modification_date": pa.string()
+	}
+	# Parse with the multithreaded Arrow CSV reader and keep the columns Arrow-backed in pandas. The file is not quoted,
+	# and only empty fields are missing values (so that e.g. the country code 'NA' of Namibia is kept as a string).
+	table = pacsv.read_csv(
+		'allCountries.txt',
+		read_options=pacsv.ReadOptions(column_names=list(column_types)),
+		parse_options=pacsv.ParseOptions(delimiter='\t', quote_char=False),
+		convert_options=pacsv.ConvertOptions(column_types=column_types, null_values=[''], strings_can_be_null=True)
+	)
+	df = table.to_pandas(types_mapper=pd.ArrowDtype)
 
 	# Subset to level
 	if level == 'city':
@@ -59,34 +67,79 @@ def create_index(level = 'city'):
 	# Replace missing alternatenames with the city's main name
 	df['alternatenames'] = df['alternatenames'].fillna(df.name)
 
-	# Sort by alternate name and population (highest population first)
-	df.sort_values(['alternatenames', 'population'], ascending=False, inplace=True)
-
-	# Keep only the first occurrence of each alternate name (highest population city)
-	df.drop_duplicates(subset='alternatenames', keep='first', inplace=True)
+	# Keep only the row with the highest population for each alternate name. A grouped argmax avoids sorting the
+	# whole dataset by name and population. Missing populations count as 0, as idxmax fails for all-missing groups.
+	df['population'] = df['population'].fillna(0)
+	df = df.loc[df.groupby('alternatenames', sort=False)['population'].idxmax()]
 
 	# Rename the column for consistency
 	df.rename(columns={'alternatenames': "key"}, inplace=True)
 
 	# Remove all rows where the key is less than 3 characters long
 	df = df[df.key.notna()]
-	df = df[df.key.apply(len) > 2]
+	df = df[df.key.str.len() > 2]
 
 	# Convert the DataFrame into a dictionary indexed by city name (including alternatenames)
 	df['coordinates'] = list(zip(df.latitude, df.longitude))
-	cols = ['key', 'name', 'country_code', 'population', 'timezone', 'coordinates']
-	index = {row.key: {col: row[col] for col in cols if col != 'key'} for row in df[cols].to_records(index=False)}
+	cols = ['key', 'geonameid'] + FIELDS
+	return {row[0]: tuple(row)[1:] for row in df[cols].to_records(index=False)}
 
-	# Save the index as a JSON file
-	#with open(f"data/{level}_index.json", "w") as fp:
-	#	json.dump(index, fp, default=lambda x: int(x) if isinstance(x, np.integer) else x)
 
-	with gzip.open(f"../geomentions/data/{level}_index.json.gz", "wt", encoding="utf-8") as fp:
-		json.dump(index, fp, default=lambda x: int(x) if isinstance(x, np.integer) else x)
+def to_json(value):
+	"""
+	Convert values that the json module cannot serialize: NumPy integers and missing values of Arrow-backed columns.
+	"""
+	if isinstance(value, np.integer):
+		return int(value)
+	if value is pd.NA:
+		return None
+	raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
-create_index('city')
-create_index('country')
+def save_index(city_index, country_index):
+	"""
+	Save the city and country indices as a single shared index file.
 
+	Each location is stored only once in a shared record table, no matter how many alternate names point to it. Both
+	indices then map their keys to the position of the location in this table. The table is stored column by column,
+	with country codes and time zones replaced by their position in a list of distinct values. The result is written
+	as a gzipped JSON file 'index.json.gz' to the '../geomentions/data/' directory.
 
+	Parameters:
+	    city_index (dict): The city index as returned by `create_index('city')`.
+	    country_index (dict): The country index as returned by `create_index('country')`.
 
+	Returns:
+	    None
+	"""
+	records = {'name': [], 'country_code': [], 'population': [], 'timezone': [], 'latitude': [], 'longitude': []}
+	country_codes = {}
+	timezones = {}
+	record_ids = {}
+	levels = {}
+	for level, index in (('city', city_index), ('country', country_index)):
+		keys = {}
+		for key, (geonameid, name, country_code, population, timezone, coordinates) in index.items():
+			if geonameid not in record_ids:
+				record_ids[geonameid] = len(record_ids)
+				records['name'].append(name)
+				records['country_code'].append(country_codes.setdefault(country_code, len(country_codes)))
+				records['population'].append(population)
+				records['timezone'].append(timezones.setdefault(timezone, len(timezones)))
+				records['latitude'].append(coordinates[0])
+				records['longitude'].append(coordinates[1])
+			keys[key] = record_ids[geonameid]
+		levels[level] = keys
+
+	data = {
+		'country_codes': list(country_codes),
+		'timezones': list(timezones),
+		'records': records,
+		'city': levels['city'],
+		'country': levels['country'],
+	}
+	with gzip.open("../geomentions/data/index.json.gz", "wt", encoding="utf-8") as fp:
+		json.dump(data, fp, separators=(',', ':'), default=to_json)
+
+
+save_index(create_index('city'), create_index('country'))
@@ -1,5 +1,8 @@
+import multiprocessing
+
 import pytest
 from geomentions import GeoMentions, GeoMentionsResult, CityMention, GeoResult
+from geomentions.geomentions import casefold_index, load_index, load_phrase_table
 
 
 def test_georesult_initialization_valid_data():
@@ -31,6 +34,12 @@ def test_georesult_initialization_missing_data():
     assert geo_result.coordinates is None  # Default value is None if not present
 
 
+def test_georesult_has_no_instance_dict():
+    geo_result = GeoResult(name="Munich", entry={'name': "Munich"})
+
+    assert not hasattr(geo_result, "__dict__")
+
+
 def test_geomentions_split_text_valid():
     text = "München ist in Deutschland, Munich is in Germany"
     gt = GeoMentions()
@@ -67,29 +76,75 @@ def test_geomentions_split_text_with_special_characters():
     assert result == expected
 
 
-def test_geomentions_generate_bigrams_valid():
-    words = ["München", "ist", "in", "Deutschland"]
-    gt = GeoMentions()
-    result = gt._generate_bigrams(words)
+def test_geomentions_split_text_ascii_matches_unicode_pattern():
+    from geomentions.geomentions import _ASCII_TOKEN_RE, _TOKEN_RE
 
-    expected = [("München", "ist"), ("ist", "in"), ("in", "Deutschland")]
-    assert result == expected
+    text = "St.-Martin's 2nd airport isn't in Las-Vegas, it's in New York''s O'Hare 123abc"
+    assert _ASCII_TOKEN_RE.findall(text) == _TOKEN_RE.findall(text)
 
 
-def test_geomentions_generate_bigrams_empty():
-    words = []
-    gt = GeoMentions()
-    result = gt._generate_bigrams(words)
+def test_geomentions_build_phrase_table():
+    index = {"New York City": {}, "New Delhi": {}, "Munich": {}}
+    result = GeoMentions._build_phrase_table(index)
 
-    assert result == []
+    assert result == {"New York City", "New Delhi", "Munich", "New", "New York"}
+
+
+def test_geomentions_phrase_table_shared_between_instances():
+    first, second = GeoMentions(), GeoMentions()
+    first.fit("I went to Munich.")
+    second.fit("I went to Munich.")
+
+    assert first._phrases is second._phrases
+
+    second.city_index = {"Munich": {'name': "Munich"}}
+    second.fit("I went to Munich.")
 
+    assert first._phrases is not second._phrases
+    assert first._phrases is load_phrase_table(False) is load_phrase_table()
 
-def test_geomentions_generate_bigrams_single_word():
-    words = ["München"]
+
+def test_geomentions_shared_index_is_read_only():
+    entry = {'name': "Zorblax", 'country_code': "DE", 'population': 1000, 'timezone': "Europe/Berlin",
+             'coordinates': (50.0, 10.0)}
+    first, second = GeoMentions(), GeoMentions()
+    first.fit("warm up")
+
+    with pytest.raises(TypeError):
+        first.city_index["Zorblax"] = entry
+    with pytest.raises(TypeError):
+        first.city_index["Munich"]["population"] = 0
+    with pytest.raises(TypeError):
+        first.city_index["Munich"]["coordinates"][0] = 0
+
+    first.city_index = {**first.city_index, "Zorblax": entry}
+
+    assert [city.name for city in first.fit("I live in Zorblax").city_mentions] == ["Zorblax"]
+    assert second.fit("I live in Zorblax").city_mentions == []
+
+
+def test_load_index_is_shared_between_calls():
+    assert load_index() is load_index(False) is load_index(casefold=False)
+    assert load_index(True) is load_index(casefold=1)
+
+
+def test_geomentions_scan_leftmost_longest():
+    entry = {
+        'name': "New York City",
+        'country_code': "US",
+        'population': 8804190,
+        'timezone': "America/New_York",
+        'coordinates': [40.71427, -74.00597]
+    }
+    # Mocked index for testing
     gt = GeoMentions()
-    result = gt._generate_bigrams(words)
+    gt.city_index = {"New York": entry, "New York City": entry, "York": entry}
+    gt.country_index = {}
 
-    assert result == []
+    cities, countries = gt._scan(["I", "love", "New", "York", "City", "and", "York"])
+
+    assert [city.key for city in cities] == ["New York City", "York"]
+    assert countries == []
 
 
 def test_geomentions_find_mentions_city():
@@ -150,6 +205,33 @@ def test_geomentions_count_results():
     assert result[0].country_code == "DE"
 
 
+def test_geomentions_count_results_top_k():
+    entries = {
+        name: {'name': name, 'country_code': "DE", 'population': 1000000, 'timezone': "CET", 'coordinates': None}
+        for name in ["Munich", "Berlin", "Hamburg"]
+    }
+    geo_results = [GeoResult(name=name, entry=entries[name]) for name in
+                   ["Hamburg", "Munich", "Berlin", "Munich", "Berlin", "Munich"]]
+
+    gt = GeoMentions()
+    result = gt.count_results(geo_results, standardize_names=True, top_k=2)
+
+    assert [(city.name, city.count) for city in result] == [("Munich", 3), ("Berlin", 2)]
+    assert result == gt.count_results(geo_results, standardize_names=True)[:2]
+
+
+def test_geomentions_count_results_same_name_reports_last_record():
+    bremen_de = {'name': "Bremen", 'country_code': "DE", 'population': 546501, 'timezone': "Europe/Berlin", 'coordinates': None}
+    bremen_us = {'name': "Bremen", 'country_code': "US", 'population': 6355, 'timezone': "America/New_York", 'coordinates': None}
+    geo_results = [GeoResult(name="Berlin", entry={'name': "Berlin"}), GeoResult(name="Бримен", entry=bremen_de),
+                   GeoResult(name="Bremen", entry=bremen_us)]
+
+    result = GeoMentions().count_results(geo_results, standardize_names=True)
+
+    assert [(city.name, city.count) for city in result] == [("Bremen", 2), ("Berlin", 1)]
+    assert (result[0].country_code, result[0].population) == ("US", 6355)
+
+
 def test_geomentions_fit_valid():
     text = "München ist in Deutschland, Munich is in Germany"
     gt = GeoMentions()
@@ -157,9 +239,9 @@ def test_geomentions_fit_valid():
 
     assert isinstance(result, GeoMentionsResult)
     assert len(result.city_mentions) == 1
-    expected = [CityMention(name='Munich', count=2, country_code='DE', population=1260391, coordinates=[48.13743, 11.57549])]
+    expected = [CityMention(name='Munich', count=2, country_code='DE', population=1260391, coordinates=(48.13743, 11.57549))]
     assert result.city_mentions == expected
-    expected = [CityMention(name='Federal Republic of Germany', count=2, country_code='DE', population=82927922, coordinates=[51.5, 10.5])]
+    expected = [CityMention(name='Federal Republic of Germany', count=2, country_code='DE', population=82927922, coordinates=(51.5, 10.5))]
     assert result.country_mentions == expected
 
 
@@ -170,14 +252,123 @@ def test_geomentions_fit_valid_non_standardization():
 
     assert isinstance(result, GeoMentionsResult)
     assert len(result.city_mentions) == 2
-    expected = [CityMention(name='München', count=1, country_code='DE', population=1260391, coordinates=[48.13743, 11.57549]),
-                CityMention(name='Munich', count=1, country_code='DE', population=1260391, coordinates=[48.13743, 11.57549])]
+    expected = [CityMention(name='München', count=1, country_code='DE', population=1260391, coordinates=(48.13743, 11.57549)),
+                CityMention(name='Munich', count=1, country_code='DE', population=1260391, coordinates=(48.13743, 11.57549))]
     assert result.city_mentions == expected
     assert len(result.country_mentions) == 2
-    expected = [CityMention(name='Deutschland', count=1, country_code='DE', population=82927922, coordinates=[51.5, 10.5]),
-                CityMention(name='Germany', count=1, country_code='DE', population=82927922, coordinates=[51.5, 10.5])]
+    expected = [CityMention(name='Deutschland', count=1, country_code='DE', population=82927922, coordinates=(51.5, 10.5)),
+                CityMention(name='Germany', count=1, country_code='DE', population=82927922, coordinates=(51.5, 10.5))]
     assert result.country_mentions == expected
 
+def test_geomentions_fit_splits_text_once():
+    gt = GeoMentions()
+    split_text = gt._split_text
+    calls = []
+    gt._split_text = lambda text: calls.append(text) or split_text(text)
+
+    result = gt.fit("München ist in Deutschland, Munich is in Germany")
+
+    assert calls == ["München ist in Deutschland, Munich is in Germany"]
+    assert len(result.city_mentions) == 1
+    assert len(result.country_mentions) == 1
+
+def test_geomentions_fit_cache():
+    text = "München ist in Deutschland, Munich is in Germany"
+    gt = GeoMentions(cache_size=1)
+    first = gt.fit(text)
+    first.city_mentions.clear()
+
+    scan = gt._scan
+    gt._scan = lambda words: pytest.fail("cached text was processed again")
+    second = gt.fit(text)
+
+    assert len(second.city_mentions) == 1
+    assert second.city_mentions[0].name == "Munich"
+
+    gt._scan = scan
+    gt.fit("I went to Paris.")
+
+    assert list(gt._cache) == [(True, None, "I went to Paris.")]
+
+    gt.city_index = {}
+
+    assert len(gt._cache) == 0
+
+def test_geomentions_fit_case_insensitive():
+    text = "MÜNCHEN liegt in deutschland, munich is in GERMANY"
+    gt = GeoMentions(case_sensitive=False)
+    result = gt.fit(text)
+
+    assert gt._split_text("München's") == ["münchen"]
+    assert result.city_mentions == [CityMention(name='Munich', count=2, country_code='DE', population=1260391, coordinates=(48.13743, 11.57549))]
+    assert result.country_mentions == [CityMention(name='Federal Republic of Germany', count=2, country_code='DE', population=82927922, coordinates=(51.5, 10.5))]
+
+    assert GeoMentions().fit(text).city_mentions == []
+
+
+def test_geomentions_switch_case_sensitive_after_fit():
+    gt = GeoMentions(cache_size=2)
+    assert gt.fit("i live in munich").city_mentions == []
+
+    gt.case_sensitive = False
+
+    assert [city.name for city in gt.fit("i live in munich").city_mentions] == ["Munich"]
+
+
+def test_geomentions_casefold_index_keeps_highest_population():
+    small = {'name': "Small", 'population': 10}
+    large = {'name': "Large", 'population': 1000}
+    result = casefold_index({"NICE": small, "Nice": large, "Paris": small})
+
+    assert result == {"nice": large, "paris": small}
+
+def test_geomentions_fit_batch():
+    texts = ["München ist in Deutschland, Munich is in Germany", "", "I went to Munich.", "Берлин and Berlin"]
+    gt = GeoMentions()
+    expected = [gt.fit(text) for text in texts]
+
+    for n_jobs in (1, 2):
+        result = gt.fit_batch(texts, n_jobs=n_jobs)
+
+        assert [r.city_mentions for r in result] == [r.city_mentions for r in expected]
+        assert [r.country_mentions for r in result] == [r.country_mentions for r in expected]
+
+
+def test_geomentions_fit_batch_custom_index():
+    entry = {
+        'name': "Munich",
+        'country_code': "DE",
+        'population': 1500000,
+        'timezone': "CET",
+        'coordinates': "48.1351,11.5820"
+    }
+    gt = GeoMentions()
+    gt.city_index = {"Berlin": entry}
+
+    result = gt.fit_batch(["I visited Berlin", "I visited Munich"], n_jobs=2)
+
+    assert [len(r.city_mentions) for r in result] == [1, 0]
+    assert result[0].city_mentions[0].population == 1500000
+
+def test_geomentions_fit_batch_spawn_with_copied_default_index():
+    gt = GeoMentions()
+    gt.city_index = {**gt.city_index, "Zorblax": {'name': "Zorblax", 'country_code': "DE", 'population': 1000,
+                                                  'timezone': "Europe/Berlin", 'coordinates': (50.0, 10.0)}}
+    texts = ["I visited Zorblax", "I went to Munich."]
+
+    result = gt.fit_batch(texts, n_jobs=2, mp_context=multiprocessing.get_context("spawn"))
+
+    assert [r.city_mentions for r in result] == [gt.fit(text).city_mentions for text in texts]
+
+def test_geomentions_init_worker(monkeypatch):
+    import geomentions.geomentions as module
+
+    monkeypatch.setattr(module, "load_index", lambda casefold=False: pytest.fail("default index was loaded"))
+    module._init_worker(True, 5, True, ({"Berlin": {'name': "Berlin"}}, {}))
+
+    assert module._worker.cache_size == 5
+    assert [city.name for city in module._worker.fit("I visited Berlin").city_mentions] == ["Berlin"]
+
 def test_geomentions_fit_empty_text():
     text = ""
     gt = GeoMentions()
@@ -237,3 +428,19 @@ def test_geomentions_result_country_counts():
     assert country_counts["DE"]["total_count"] == 9
     assert country_counts["DE"]["implicit_count"] == 8
     assert country_counts["DE"]["explicit_count"] == 1
+
+
+def test_geomentions_result_country_counts_implicit_and_explicit_only():
+    city_mentions = [
+        CityMention(name="Paris", count=2, country_code="FR", population=2200000, coordinates="48.8566,2.3522"),
+        CityMention(name="Nowhere", count=4, country_code=None, population=0, coordinates=None)
+    ]
+    country_mentions = [
+        CityMention(name="Germany", count=3, country_code="DE", population=83000000, coordinates="51.1657,10.4515")
+    ]
+    geo_result = GeoMentionsResult(city_mentions, country_mentions)
+
+    assert geo_result.country_counts == {
+        "FR": {"total_count": 2, "implicit_count": 2, "explicit_count": 0},
+        "DE": {"total_count": 3, "implicit_count": 0, "explicit_count": 3},
+    }